@@ -1,9 +1,22 @@
 import os
-import folium
+
+#in production, patch blocking I/O before anything else imports socket/ssl
+PRODUCTION = os.getenv('APP_ENV') == 'production'
+if PRODUCTION:
+    from gevent import monkey
+    monkey.patch_all()
+
+import glob
+import time
+import hashlib
+import tempfile
+import threading
 import googlemaps
+import orjson
 import webbrowser
 from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from services.parking_predictor import ParkingPredictor
 from services.parking_finder import ParkingFinder
 from services.parking_visualizer import ParkingVisualizer
@@ -16,6 +29,10 @@ app = Flask(__name__,
            template_folder=os.path.join(PROJECT_ROOT, 'display'),  # Updated path
            static_folder=os.path.join(PROJECT_ROOT, 'display'))    # Updated path
 
+# Rendered static maps are cached on disk for up to an hour
+MAP_CACHE_DIR = os.path.join(PROJECT_ROOT, 'display', 'cache')
+MAP_CACHE_TTL = 3600
+
 load_dotenv()
 
 # Initialize services
@@ -24,6 +41,22 @@ finder = ParkingFinder(use_mock=False)
 gmaps_client = googlemaps.Client(key=os.getenv('GOOGLE_API_KEY'))
 weather_api_key = os.getenv('WEATHER_API_KEY')
 
+# Shared visualizer keeps its base map between builds; the lock serializes map rebuilds
+visualizer = ParkingVisualizer(
+    [],
+    predictor=predictor,
+    gmaps_client=gmaps_client,
+    weather_api_key=weather_api_key
+)
+map_lock = threading.Lock()
+
+def map_is_fresh(path):
+    #check whether a cached map exists and is still within its ttl
+    try:
+        return time.time() - os.path.getmtime(path) < MAP_CACHE_TTL
+    except FileNotFoundError:
+        return False
+
 @app.route('/')
 def static_map():
     #this will generate a static map (planning to transition to dynamic)
@@ -32,26 +65,42 @@ def static_map():
         CENTER_LON = -73.676871
         SEARCH_RADIUS = 1000
 
-        print("Getting parking locations...")
-        parking_locations = finder.get_parking_locations(CENTER_LAT, CENTER_LON, SEARCH_RADIUS)
-        print(f"Found {len(parking_locations)} parking locations")
-        
-        print("Creating map...")
-        visualizer = ParkingVisualizer(
-            parking_locations,
-            predictor=predictor,
-            gmaps_client=gmaps_client,
-            weather_api_key=weather_api_key
-        )
-        map_obj = visualizer.create_map()
-        
-        #use absolute path to save the file
-        output_file = os.path.join(PROJECT_ROOT, 'display', 'parking_map.html')
-        print(f"Saving map to {output_file}")
-        map_obj.save(output_file)
+        #reuse the rendered map for the same area within the same hour
+        cache_key = (round(CENTER_LAT, 3), round(CENTER_LON, 3), time.strftime('%Y%m%d%H', time.gmtime()))
+        cache_name = hashlib.sha1(repr(cache_key).encode()).hexdigest()
+        output_file = os.path.join(MAP_CACHE_DIR, f'{cache_name}.html')
+        if map_is_fresh(output_file):
+            print("Serving cached map file...")
+            return send_file(output_file, conditional=True)
+
+        with map_lock:
+            #another request may have built this map while we waited for the lock
+            if not map_is_fresh(output_file):
+                print("Getting parking locations...")
+                parking_locations = finder.get_parking_locations(CENTER_LAT, CENTER_LON, SEARCH_RADIUS)
+                print(f"Found {len(parking_locations)} parking locations")
+                
+                print("Creating map...")
+                visualizer.set_locations(parking_locations)
+                html = visualizer.render_html()
+                
+                #write to a temp file and swap it in so concurrent requests never see a partial map
+                print(f"Saving map to {output_file}")
+                os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=MAP_CACHE_DIR, suffix='.tmp', delete=False) as tmp:
+                    tmp.write(html.encode('utf-8'))
+                os.replace(tmp.name, output_file)
+                
+                #drop maps cached for earlier hours
+                for stale_file in glob.glob(os.path.join(MAP_CACHE_DIR, '*.html')):
+                    if stale_file != output_file:
+                        try:
+                            os.remove(stale_file)
+                        except FileNotFoundError:
+                            pass
         
         print("Serving map file...")
-        return send_file(output_file)
+        return send_file(output_file, conditional=True)
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -73,32 +122,74 @@ def update_parking():
         #get parking locations using finder
         parking_locations = finder.get_parking_locations(user_lat, user_lon, radius=1000)
         
-        parking_data = []
-        for location in parking_locations:
+        #events and weather are shared by every lot near the user, so fetch them once;
+        #the event search is widened so lots away from the user still see venues near them
+        event_radius = predictor.event_search_radius(user_lat, user_lon, parking_locations)
+        events, event_arrays = predictor.get_nearby_events(gmaps_client, user_lat, user_lon, event_radius)
+        weather = predictor.get_weather_impact(user_lat, user_lon, weather_api_key)
+        
+        #time based factors are the same for every lot
+        timestamp = datetime.now()
+        prefactors = predictor.get_prefactors(timestamp)
+        
+        #draw noise for every lot in one batch
+        noise = predictor.sample_noise(len(parking_locations))
+        
+        def predict(location, location_noise):
             #get prediction for each location
-            prediction = predictor.predict_occupancy(
+            prediction = predictor.predict_occupancy_precomputed(
                 location=location,
-                gmaps_client=gmaps_client,
-                weather_api_key=weather_api_key
+                events=events,
+                weather=weather,
+                event_arrays=event_arrays,
+                timestamp=timestamp,
+                noise=location_noise,
+                prefactors=prefactors
             )
             
             #combine location and prediction data
-            parking_data.append({
+            return {
                 **prediction,
                 'name': location.name,
                 'latitude': location.latitude,
                 'longitude': location.longitude,
                 'lot_type': location.access_type
-            })
+            }
+        
+        def stream():
+            #predict lots concurrently and send each one as soon as it is ready
+            yield b'['
+            with ThreadPoolExecutor(max_workers=max(1, min(16, len(parking_locations)))) as executor:
+                futures = {
+                    executor.submit(predict, location, location_noise): location
+                    for location, location_noise in zip(parking_locations, noise.tolist())
+                }
+                first = True
+                for future in as_completed(futures):
+                    #the response has already started, so leave a failed lot out rather than break the array
+                    try:
+                        row = orjson.dumps(future.result(), option=orjson.OPT_SERIALIZE_NUMPY)
+                    except Exception as e:
+                        print(f"Error predicting {futures[future].name}: {e}")
+                        continue
+                    if not first:
+                        yield b','
+                    first = False
+                    yield row
+            yield b']'
         
-        return jsonify(parking_data)
+        return app.response_class(stream(), mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 def main():
-    #run flask app
-    app.run(debug=True, port=5000)
+    #run flask app, using gevent in production so slow API calls don't block other clients
+    if PRODUCTION:
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()
+    else:
+        app.run(debug=True, port=5000)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,20 @@
+from typing import Tuple
+
+
+#occupancy classes as (lower bound, status, color), shared by the predictor, the fallback and the map legend
+STATUS_BINS = (
+    (0.0, "Available", "green"),
+    (0.4, "Moderate", "yellow"),
+    (0.7, "Nearly Full", "orange"),
+    (0.9, "Full", "red"),
+)
+
+
+def classify_occupancy(occupancy: float) -> Tuple[str, str]:
+    """Return the status and color for an occupancy fraction"""
+    status, color = STATUS_BINS[0][1:]
+    for lower, bin_status, bin_color in STATUS_BINS[1:]:
+        if occupancy < lower:
+            break
+        status, color = bin_status, bin_color
+    return status, color
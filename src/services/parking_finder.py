@@ -1,10 +1,10 @@
 import os
-import sys
+import threading
 import googlemaps
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from dataclasses import dataclass
 from dotenv import load_dotenv
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.parking_spot import ParkingLocation
 
 #this loads the env variables (api keys)
@@ -19,6 +19,11 @@ class ParkingFinder:
                 raise ValueError("Google API key is required")
             self.client = googlemaps.Client(key=self.api_key)
 
+        #places results change on the order of hours, details even less often
+        self._location_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._detail_cache = TTLCache(maxsize=1024, ttl=86400)
+        self._cache_lock = threading.Lock()
+
     def get_mock_data(self) -> List[ParkingLocation]:
         """Return mock parking data for testing"""
         return [
@@ -46,9 +51,39 @@ class ParkingFinder:
             )
         ]
 
+    def _fetch_detail(self, place: dict) -> ParkingLocation:
+        """Fetch place details for a nearby search result"""
+        place_id = place['place_id']
+        with self._cache_lock:
+            place_details = self._detail_cache.get(place_id)
+        if place_details is None:
+            place_details = self.client.place(place_id)['result']
+            with self._cache_lock:
+                self._detail_cache[place_id] = place_details
+        #join weekday hours into one string so locations stay hashable
+        weekday_text = place_details.get('opening_hours', {}).get('weekday_text')
+        return ParkingLocation(
+            id=place['place_id'],
+            name=place['name'],
+            latitude=place['geometry']['location']['lat'],
+            longitude=place['geometry']['location']['lng'],
+            address=place_details.get('formatted_address'),
+            hours_of_operation='; '.join(weekday_text) if weekday_text else None,
+            source='google_places',
+            fee=place_details.get('business_status') == 'OPERATIONAL',
+            access_type='public'
+        )
+
     def get_parking_locations(self, lat: float, lon: float, radius: int = 1000) -> List[ParkingLocation]:
         if self.use_mock:
             return self.get_mock_data()
+
+        #quantize to ~100m cells so nearby users share cached results
+        cache_key = (round(lat, 3), round(lon, 3), radius)
+        with self._cache_lock:
+            cached = self._location_cache.get(cache_key)
+        if cached is not None:
+            return cached
             
         try:
             places_result = self.client.places_nearby(
@@ -57,22 +92,14 @@ class ParkingFinder:
                 keyword='parking'
             )
             
-            parking_locations = []
-            for place in places_result.get('results', []):
-                place_details = self.client.place(place['place_id'])['result']
-                location = ParkingLocation(
-                    id=place['place_id'],
-                    name=place['name'],
-                    latitude=place['geometry']['location']['lat'],
-                    longitude=place['geometry']['location']['lng'],
-                    address=place_details.get('formatted_address'),
-                    hours_of_operation=place_details.get('opening_hours', {}).get('weekday_text'),
-                    source='google_places',
-                    fee=place_details.get('business_status') == 'OPERATIONAL',
-                    access_type='public'
-                )
-                parking_locations.append(location)
-            
+            #detail lookups are independent network calls, so fan them out
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                parking_locations = list(executor.map(
+                    self._fetch_detail, places_result.get('results', [])
+                ))
+
+            with self._cache_lock:
+                self._location_cache[cache_key] = parking_locations
             return parking_locations
         except Exception as e:
             print(f"Error fetching parking data: {e}")
@@ -1,25 +1,26 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import threading
+from collections import namedtuple
 import googlemaps
+from cachetools import TTLCache
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from math import radians, sin, cos, sqrt, atan2
+from models.parking_spot import ParkingLocation
+from numba import njit
+from services.occupancy import classify_occupancy
 
-# First define the ParkingLocation class
-@dataclass
-class ParkingLocation:
-    id: str
-    name: str
-    latitude: float
-    longitude: float
-    address: Optional[str] = None
-    hours_of_operation: Optional[str] = None
-    source: Optional[str] = None
-    fee: Optional[bool] = None
-    access_type: Optional[str] = None
+# Per lot type characteristics, unpacked from the lot_characteristics dicts
+LotInfo = namedtuple('LotInfo', ['base_capacity', 'weather_sensitivity', 'event_sensitivity',
+                                 'time_sensitivity', 'weekend_modifier'])
 
-@dataclass
+# Factors that depend only on the timestamp, with their product precomputed
+Prefactors = namedtuple('Prefactors', ['seasonal', 'special_day', 'combined'])
+
+@dataclass(slots=True, frozen=True)
 class NearbyEvent:
     name: str
     venue_name: str
@@ -31,6 +32,17 @@ class NearbyEvent:
     rating: Optional[float] = None
     user_ratings_total: Optional[int] = None
 
+@dataclass(slots=True, frozen=True)
+class EventArrays:
+    """Structure-of-arrays view of a NearbyEvent list for vectorized impact math"""
+    lats: np.ndarray            # radians
+    lons: np.ndarray            # radians
+    venue_weights: np.ndarray
+    popularity: np.ndarray      # NaN where unknown
+    rating: np.ndarray          # NaN where unknown
+    ratings_total: np.ndarray   # NaN where unknown
+    is_operational: np.ndarray
+
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate distance between two points in kilometers using Haversine formula"""
     R = 6371  # Earth's radius in kilometers
@@ -44,6 +56,22 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     
     return R * c
 
+def _local_distance_km(cos_lat0: float, lat1: float, lon1: float,
+                       lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Equirectangular distance in kilometers for points a few km apart (radian inputs).
+    Agrees with calculate_distance to well under a meter within 1km.
+    """
+    R = 6371  # Earth's radius in kilometers
+    return R * np.sqrt((lat2 - lat1)**2 + (cos_lat0 * (lon2 - lon1))**2)
+
+@njit(cache=True, nogil=True)
+def _combine(base: float, prefactors: float, time_f: float, weather_f: float,
+             event_f: float, noise: float) -> float:
+    """Multiply all occupancy factors, add noise and clip to [0, 1]"""
+    occupancy = base * prefactors * time_f * weather_f * event_f + noise
+    return max(0.0, min(1.0, occupancy))
+
 class ParkingPredictor:
     def __init__(self):
         # Time-based factors - adjusted for typical work/class schedules
@@ -106,6 +134,35 @@ class ParkingPredictor:
             }
         }
 
+        self._lot_info = {
+            lot_type: LotInfo(**characteristics)
+            for lot_type, characteristics in self.lot_characteristics.items()
+        }
+
+        # Time factors for each hour of the day. A period covers the hours
+        # start, start+1, ... mod 24, so late night wraps past midnight without
+        # a special case. Periods are applied in reverse so the first listed wins.
+        hour_factors = {}
+        hour_periods = {}
+        for day_type, time_periods in self.time_factors.items():
+            factors = np.ones(24)
+            periods = np.full(24, "Normal hours", dtype=object)
+            for period, (start, end, factor) in reversed(time_periods.items()):
+                hours = np.arange(start, start + (end - start) % 24) % 24
+                factors[hours] = factor
+                periods[hours] = period
+            hour_factors[day_type] = factors
+            hour_periods[day_type] = periods
+
+        # Time factors for every hour of the week, indexed by weekday * 24 + hour
+        week = ['weekday'] * 5 + ['weekend'] * 2
+        self._period_name_table = np.concatenate([hour_periods[day_type] for day_type in week])
+        self._time_factor_table = {
+            lot_type: 1 + (np.concatenate([hour_factors[day_type] for day_type in week]) - 1)
+                          * lot_info.time_sensitivity
+            for lot_type, lot_info in self._lot_info.items()
+        }
+
         # Seasonal factors (based on month)
         self.seasonal_factors = {
             1: 1.1,   # January - Winter weather impact
@@ -147,6 +204,10 @@ class ParkingPredictor:
             (85, float('inf'), 1.2)    # Hot - more driving
         ]
 
+        # Bin edges and impacts for a searchsorted lookup over temperature_factors
+        self._temp_edges = np.array([max_temp for _, max_temp, _ in self.temperature_factors[:-1]])
+        self._temp_impacts = np.array([impact for _, _, impact in self.temperature_factors])
+
         # Special day types
         self.special_day_factors = {
             'holiday': 0.4,            # Holiday
@@ -168,6 +229,19 @@ class ParkingPredictor:
             'remote': 0.6              # Remote location
         }
 
+        # Venue type impact on nearby parking demand
+        self.venue_type_weights = {
+            'stadium': 2.0,            # Games and concerts
+            'convention_center': 1.8,  # Conferences and expos
+            'university': 1.6,         # Campus events
+            'shopping_mall': 1.5,      # Steady retail traffic
+            'movie_theater': 1.4,      # Showtime peaks
+            'museum': 1.3,             # Exhibits
+            'night_club': 1.3,         # Evening crowds
+            'restaurant': 1.2,         # Meal times
+            'church': 1.2              # Services
+        }
+
         # Lot size impact (bigger lots tend to have more availability)
         self.size_factors = {
             'small': 1.2,              # <50 spaces
@@ -175,104 +249,201 @@ class ParkingPredictor:
             'large': 0.8               # >200 spaces
         }
 
+        # Response caches keyed by ~100m grid cell, expired lazily on access
+        self._events_cache = TTLCache(maxsize=1024, ttl=600)
+        self._weather_cache = TTLCache(maxsize=1024, ttl=600)
+        self._cache_lock = threading.Lock()
+
+        # Noise generators; a Generator isn't thread-safe, so each thread spawns its own
+        self._seed_seq = np.random.SeedSequence()
+        self._rng_local = threading.local()
+        self._rng_lock = threading.Lock()
+
+        # Shared session keeps weather API connections alive between calls
+        self._http = requests.Session()
+        self._http.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
     def predict_occupancy(self, location: ParkingLocation,
                          gmaps_client: googlemaps.Client,
                          lot_type: str = 'public',
                          timestamp: Optional[datetime] = None,
-                         weather_api_key: Optional[str] = None) -> Dict:
+                         weather_api_key: Optional[str] = None,
+                         weather: Optional[Dict] = None) -> Dict:
+        """
+        Enhanced prediction incorporating all factors. Pass weather to reuse
+        an already fetched weather impact.
+        """
+        # Get weather impact
+        if weather is None:
+            weather = self.get_weather_impact(
+                location.latitude, 
+                location.longitude,
+                weather_api_key
+            )
+
+        # Get nearby events
+        events, event_arrays = self.get_nearby_events(
+            gmaps_client,
+            location.latitude,
+            location.longitude
+        )
+
+        return self.predict_occupancy_precomputed(
+            location, events, weather,
+            timestamp=timestamp,
+            lot_type=lot_type,
+            event_arrays=event_arrays
+        )
+
+    def predict_occupancy_precomputed(self, location: ParkingLocation,
+                                      events: List[NearbyEvent],
+                                      weather: Dict,
+                                      timestamp: Optional[datetime] = None,
+                                      lot_type: str = 'public',
+                                      event_arrays: Optional[EventArrays] = None,
+                                      noise: Optional[float] = None,
+                                      prefactors: Optional[Prefactors] = None) -> Dict:
         """
-        Enhanced prediction incorporating all factors
+        Predict occupancy from already fetched events and weather, so callers
+        predicting many nearby lots only hit the APIs once
         """
         if timestamp is None:
             timestamp = datetime.now()
 
         # Get base characteristics
-        lot_info = self.lot_characteristics.get(lot_type, self.lot_characteristics['public'])
-        base_occupancy = lot_info['base_capacity']
+        lot_info = self._lot_info.get(lot_type, self._lot_info['public'])
+        base_occupancy = lot_info.base_capacity
+
+        # Get seasonal and special day factors
+        if prefactors is None:
+            prefactors = self.get_prefactors(timestamp)
 
-        # Apply seasonal factor
-        month = timestamp.month
-        seasonal_factor = self.seasonal_factors[month]
-        base_occupancy *= seasonal_factor
+        # Calculate distance factor (you'll need to implement logic to determine if central/peripheral/remote)
+        distance_factor = self.get_distance_factor(location)
 
         # Apply weekend modifier if applicable
         is_weekend = timestamp.weekday() >= 5
         if is_weekend:
-            base_occupancy *= lot_info['weekend_modifier']
+            base_occupancy *= lot_info.weekend_modifier
 
         # Get time impact
         time_impact = self.get_time_factor(timestamp, lot_type)
         
-        # Get weather impact
-        weather_impact = self.get_weather_impact(
-            location.latitude, 
-            location.longitude,
-            weather_api_key
-        )
-        weather_factor = 1 + ((weather_impact['factor'] - 1) * lot_info['weather_sensitivity'])
+        # Apply weather impact
+        weather_factor = 1 + ((weather['factor'] - 1) * lot_info.weather_sensitivity)
 
         # Get nearby events impact
-        events = self.get_nearby_events(
-            gmaps_client,
-            location.latitude,
-            location.longitude
-        )
-        event_impact = self.calculate_event_impact(location, events, timestamp)
-        event_factor = 1 + ((event_impact['factor'] - 1) * lot_info['event_sensitivity'])
+        event_impact = self.calculate_event_impact(location, events, timestamp, event_arrays)
+        event_factor = 1 + ((event_impact['factor'] - 1) * lot_info.event_sensitivity)
 
-        # Calculate special day impact if applicable
-        special_day_factor = self.get_special_day_factor(timestamp)
-
-        # Calculate distance factor (you'll need to implement logic to determine if central/peripheral/remote)
-        distance_factor = self.get_distance_factor(location)
+        # Add small random variation (reduced from 0.03 to 0.02 for more stability)
+        if noise is None:
+            noise = self._rng().normal(0, 0.02)
 
         # Calculate final occupancy with all factors
-        occupancy = (base_occupancy * 
-                    time_impact['factor'] * 
-                    weather_factor * 
-                    event_factor * 
-                    special_day_factor * 
-                    distance_factor)
+        occupancy = _combine(base_occupancy,
+                             prefactors.combined * distance_factor,
+                             time_impact['factor'],
+                             weather_factor,
+                             event_factor,
+                             noise)
 
-        # Add small random variation (reduced from 0.03 to 0.02 for more stability)
-        occupancy += np.random.normal(0, 0.02)
-        occupancy = max(0.0, min(1.0, occupancy))
-
-        # Determine status and color with more granular thresholds
-        if occupancy >= 0.9:
-            status = "Full"
-            color = "red"
-        elif occupancy >= 0.7:
-            status = "Nearly Full"
-            color = "orange"
-        elif occupancy >= 0.4:
-            status = "Moderate"
-            color = "yellow"
-        else:
-            status = "Available"
-            color = "green"
+        # Determine status and color from the shared occupancy classes
+        status, color = classify_occupancy(occupancy)
 
         return {
             "status": status,
             "color": color,
             "occupancy": round(occupancy * 100, 1),
             "factors": {
-                "seasonal": round(seasonal_factor, 2),
+                "seasonal": round(prefactors.seasonal, 2),
                 "time_impact": round(time_impact['factor'], 2),
                 "weather_impact": round(weather_factor, 2),
                 "event_impact": round(event_factor, 2),
-                "special_day": round(special_day_factor, 2),
+                "special_day": round(prefactors.special_day, 2),
                 "distance": round(distance_factor, 2)
             },
             "details": {
                 "time": time_impact['description'],
-                "weather": weather_impact['description'],
+                "weather": weather['description'],
                 "significant_venues": event_impact['venues'],
                 "season": f"{timestamp.strftime('%B')} factor",
                 "lot_type": lot_type
             }
         }
 
+    def predict_occupancy_batch(self, locations: List[ParkingLocation],
+                                gmaps_client: googlemaps.Client,
+                                weather_api_key: Optional[str] = None,
+                                lot_type: str = 'public',
+                                timestamp: Optional[datetime] = None) -> List[Dict]:
+        """
+        Predict occupancy for many nearby lots, fetching weather and events
+        once around their centroid instead of once per lot
+        """
+        if not locations:
+            return []
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        center_lat = sum(location.latitude for location in locations) / len(locations)
+        center_lon = sum(location.longitude for location in locations) / len(locations)
+
+        radius_m = self.event_search_radius(center_lat, center_lon, locations)
+
+        weather = self.get_weather_impact(center_lat, center_lon, weather_api_key)
+        events, event_arrays = self.get_nearby_events(gmaps_client, center_lat, center_lon, radius_m)
+        prefactors = self.get_prefactors(timestamp)
+        noise = self.sample_noise(len(locations))
+
+        return [
+            self.predict_occupancy_precomputed(
+                location, events, weather,
+                timestamp=timestamp,
+                lot_type=lot_type,
+                event_arrays=event_arrays,
+                noise=location_noise,
+                prefactors=prefactors
+            )
+            for location, location_noise in zip(locations, noise.tolist())
+        ]
+
+    def event_search_radius(self, lat: float, lon: float,
+                            locations: List[ParkingLocation]) -> int:
+        """
+        Radius in meters for a shared event search around (lat, lon), widened
+        so every lot still sees venues within 1km of itself
+        """
+        spread_km = max((calculate_distance(lat, lon, location.latitude, location.longitude)
+                         for location in locations), default=0.0)
+        return min(int(1000 * (1.0 + spread_km)), 50000)
+
+    def _rng(self) -> np.random.Generator:
+        """Return this thread's random generator, spawning one on first use"""
+        rng = getattr(self._rng_local, 'rng', None)
+        if rng is None:
+            with self._rng_lock:
+                seed = self._seed_seq.spawn(1)[0]
+            rng = self._rng_local.rng = np.random.default_rng(seed)
+        return rng
+
+    def sample_noise(self, size: int) -> np.ndarray:
+        """Draw the occupancy noise for a batch of lots in one call"""
+        return self._rng().normal(0, 0.02, size=size)
+
+    def get_prefactors(self, timestamp: datetime) -> Prefactors:
+        """Factors shared by every lot at a given time, computed once per request"""
+        seasonal_factor = self.seasonal_factors[timestamp.month]
+
+        # Calculate special day impact if applicable
+        special_day_factor = self.get_special_day_factor(timestamp)
+
+        return Prefactors(
+            seasonal=seasonal_factor,
+            special_day=special_day_factor,
+            combined=seasonal_factor * special_day_factor
+        )
+
     # Add these new helper methods
     def get_special_day_factor(self, timestamp: datetime) -> float:
         return 1.0
@@ -282,10 +453,17 @@ class ParkingPredictor:
 
     def get_nearby_events(self, gmaps_client: googlemaps.Client, 
                          lat: float, lon: float, 
-                         radius_m: int = 1000) -> List[NearbyEvent]:
+                         radius_m: int = 1000) -> Tuple[List[NearbyEvent], EventArrays]:
         """
-        Fetch nearby events and venues using Google Places API
+        Fetch nearby events and venues using Google Places API, along with
+        their EventArrays for calculate_event_impact
         """
+        cache_key = (round(lat, 3), round(lon, 3), radius_m)
+        with self._cache_lock:
+            cached = self._events_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             # Search for active venues and potential event locations
             event_venues = gmaps_client.places_nearby(
@@ -320,65 +498,103 @@ class ParkingPredictor:
                 )
                 nearby_events.append(event)
 
-            return nearby_events
+            result = (nearby_events, self.build_event_arrays(nearby_events))
+            with self._cache_lock:
+                self._events_cache[cache_key] = result
+            return result
 
         except Exception as e:
             print(f"Error fetching nearby events: {e}")
-            return []
+            return [], self.build_event_arrays([])
+
+    def build_event_arrays(self, events: List[NearbyEvent]) -> EventArrays:
+        """Pack event fields into contiguous arrays, converting coordinates to radians once"""
+        def optional_array(values):
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+        return EventArrays(
+            lats=np.radians(np.array([e.latitude for e in events], dtype=np.float64)),
+            lons=np.radians(np.array([e.longitude for e in events], dtype=np.float64)),
+            venue_weights=np.array([self.venue_type_weights.get(e.place_type, 1.0) for e in events],
+                                   dtype=np.float64),
+            popularity=optional_array(e.current_popularity for e in events),
+            rating=optional_array(e.rating for e in events),
+            ratings_total=optional_array(e.user_ratings_total for e in events),
+            is_operational=np.array([e.is_operational for e in events], dtype=bool)
+        )
 
     def calculate_event_impact(self, lot_location: ParkingLocation, 
                              events: List[NearbyEvent], 
-                             current_time: datetime) -> Dict:
+                             current_time: datetime,
+                             event_arrays: Optional[EventArrays] = None) -> Dict:
         """Calculate the impact of nearby events on parking occupancy"""
         total_impact = 1.0
         significant_venues = []
-        
-        for event in events:
-            # Only consider operational venues
-            if not event.is_operational:
-                continue
-                
-            # Calculate distance to event
-            event_distance = calculate_distance(
-                lot_location.latitude, lot_location.longitude,
-                event.latitude, event.longitude
-            )
 
-            if event_distance <= 1.0:  # Within 1km
-                # Base impact calculation
-                venue_weight = self.venue_type_weights.get(event.place_type, 1.0)
-                distance_factor = 1 - (event_distance / 1.0)  # Linear decay with distance
-                
-                # Factor in venue popularity if available
-                popularity_factor = 1.0
-                if event.current_popularity is not None:
-                    popularity_factor = 1 + (event.current_popularity / 100)
-                
-                # Factor in venue rating and number of ratings
-                rating_factor = 1.0
-                if event.rating is not None and event.user_ratings_total is not None:
-                    rating_weight = min(1.0, event.user_ratings_total / 1000)  # Cap at 1000 ratings
-                    rating_factor = 1 + (((event.rating / 5) - 0.5) * rating_weight)
-                
-                # Combine all factors
-                event_impact = 1 + (
-                    venue_weight * 
-                    distance_factor * 
-                    popularity_factor * 
-                    rating_factor - 1
-                ) * 0.5  # Dampen the overall impact
-                
-                # Update total impact (use max for overlapping high-impact events)
-                total_impact = max(total_impact, event_impact)
-                
-                # Track significant venues for reporting
-                if event_impact > 1.1:  # Only include venues with notable impact
-                    significant_venues.append({
-                        'name': event.venue_name,
-                        'type': event.place_type,
-                        'distance_km': round(event_distance, 2),
-                        'impact': round(event_impact - 1, 2)
-                    })
+        if not events:
+            return {'factor': total_impact, 'venues': significant_venues}
+        if event_arrays is None:
+            event_arrays = self.build_event_arrays(events)
+
+        lot_lat, lot_lon = radians(lot_location.latitude), radians(lot_location.longitude)
+        cos_lat0 = cos(lot_lat)
+
+        # Only consider operational venues, using a cheap bounding box around
+        # the 1km radius to rule out most events before any sqrt
+        dlat_max = 1.0 / 6371
+        dlon_max = dlat_max / max(cos_lat0, 0.01)
+        candidates = np.flatnonzero(
+            event_arrays.is_operational
+            & (np.abs(event_arrays.lats - lot_lat) <= dlat_max)
+            & (np.abs(event_arrays.lons - lot_lon) <= dlon_max)
+        )
+
+        # Calculate distance to the remaining events and keep those within 1km
+        distances = _local_distance_km(cos_lat0, lot_lat, lot_lon,
+                                       event_arrays.lats[candidates], event_arrays.lons[candidates])
+        in_range = distances <= 1.0
+        candidates = candidates[in_range]
+        distances = distances[in_range]
+        if candidates.size == 0:
+            return {'factor': total_impact, 'venues': significant_venues}
+
+        # Base impact calculation, with linear decay with distance
+        venue_weight = event_arrays.venue_weights[candidates]
+        distance_factor = 1 - (distances / 1.0)
+
+        # Factor in venue popularity if available
+        popularity = event_arrays.popularity[candidates]
+        popularity_factor = 1 + np.where(np.isnan(popularity), 0.0, popularity / 100)
+
+        # Factor in venue rating and number of ratings (capped at 1000 ratings)
+        rating = event_arrays.rating[candidates]
+        ratings_total = event_arrays.ratings_total[candidates]
+        rating_factor = np.where(
+            np.isnan(rating) | np.isnan(ratings_total),
+            1.0,
+            1 + ((rating / 5) - 0.5) * np.minimum(1.0, ratings_total / 1000)
+        )
+
+        # Combine all factors, dampening the overall impact
+        event_impact = 1 + (
+            venue_weight * 
+            distance_factor * 
+            popularity_factor * 
+            rating_factor - 1
+        ) * 0.5
+
+        # Use max for overlapping high-impact events
+        total_impact = max(total_impact, float(event_impact.max()))
+
+        # Track significant venues for reporting
+        for i in np.flatnonzero(event_impact > 1.1).tolist():  # Only venues with notable impact
+            event = events[candidates[i]]
+            significant_venues.append({
+                'name': event.venue_name,
+                'type': event.place_type,
+                'distance_km': round(float(distances[i]), 2),
+                'impact': round(float(event_impact[i]) - 1, 2)
+            })
 
         return {
             'factor': total_impact,
@@ -392,10 +608,16 @@ class ParkingPredictor:
         if not api_key:
             return default_weather
 
+        cache_key = (round(lat, 3), round(lon, 3))
+        with self._cache_lock:
+            cached = self._weather_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             # Make weather API call (example using OpenWeatherMap)
             url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=imperial"
-            response = requests.get(url)
+            response = self._http.get(url, timeout=2)
             data = response.json()
 
             weather = data['weather'][0]['main']
@@ -405,42 +627,24 @@ class ParkingPredictor:
             weather_factor = self.weather_factors.get(weather, 1.0)
             
             # Apply temperature impact
-            for min_temp, max_temp, impact in self.temperature_factors:
-                if min_temp <= temp < max_temp:
-                    weather_factor *= impact
-                    break
+            idx = np.searchsorted(self._temp_edges, temp, side='right')
+            weather_factor *= float(self._temp_impacts[idx])
 
-            return {
+            weather_impact = {
                 'factor': weather_factor,
                 'description': f"{weather}, {temp}°F"
             }
+            with self._cache_lock:
+                self._weather_cache[cache_key] = weather_impact
+            return weather_impact
         except Exception as e:
             print(f"Weather API error: {e}")
             return default_weather
 
     def get_time_factor(self, timestamp: datetime, lot_type: str) -> Dict:
         """Calculate time-based impact"""
-        is_weekend = timestamp.weekday() >= 5
-        current_hour = timestamp.hour
-        
-        # Get appropriate time factors
-        time_periods = self.time_factors['weekend'] if is_weekend else self.time_factors['weekday']
-        
-        # Find applicable time period
-        time_factor = 1.0
-        period_name = "Normal hours"
-        
-        for period, (start, end, factor) in time_periods.items():
-            if start <= current_hour < end or (start > end and (current_hour >= start or current_hour < end)):
-                time_factor = factor
-                period_name = period
-                break
-
-        # Adjust for lot type
-        lot_sensitivity = self.lot_characteristics[lot_type]['time_sensitivity']
-        adjusted_factor = 1 + ((time_factor - 1) * lot_sensitivity)
-
+        idx = timestamp.weekday() * 24 + timestamp.hour
         return {
-            'factor': adjusted_factor,
-            'description': period_name
+            'factor': float(self._time_factor_table[lot_type][idx]),
+            'description': self._period_name_table[idx]
         }
\ No newline at end of file
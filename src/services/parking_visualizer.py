@@ -1,90 +1,303 @@
-import folium
-from folium import plugins
 from datetime import datetime
+import functools
 import json
-import numpy as np
+import logging
+import os
+import jinja2
+import orjson
+from markupsafe import escape
+from concurrent.futures import ThreadPoolExecutor
+from services.occupancy import STATUS_BINS, classify_occupancy
+
+log = logging.getLogger(__name__)
+
+# Fallback crowdedness multiplier for each hour of the day (peak, moderate, quiet)
+_TIME_MULT = tuple(
+    1.0 if 8 <= h < 11 or 13 <= h < 16 else 0.7 if 11 <= h < 13 or 16 <= h < 18 else 0.4
+    for h in range(24)
+)
+
+# Fallback scores use the same occupancy classes as the predictor, split out for vectorized binning
+_CROWDEDNESS_EDGES = tuple(lower for lower, _, _ in STATUS_BINS[1:])
+_CROWDEDNESS_STATUSES = tuple(label for _, label, _ in STATUS_BINS)
+_CROWDEDNESS_COLORS = tuple(color for _, _, color in STATUS_BINS)
+
+def _script_json(data):
+    """Encode data as compact JSON that is safe to embed in a <script> block"""
+    return orjson.dumps(data).decode().replace("</", "<\\/")
+
+# Above this many lots the fallback scoring runs through the numba kernel
+_NUMBA_THRESHOLD = 500
+
+@functools.lru_cache(maxsize=None)
+def _score_kernel():
+    """Compile the fallback classification kernel on first use"""
+    import numpy as np
+    from numba import njit
+
+    @njit(cache=True, nogil=True)
+    def kernel(base_scores, multiplier, edges):
+        bins = np.empty(base_scores.size, np.intp)
+        for i in range(base_scores.size):
+            crowdedness = base_scores[i] * multiplier
+            b = 0
+            while b < edges.size and crowdedness >= edges[b]:
+                b += 1
+            bins[i] = b
+        return bins
+
+    return kernel
+
+def _base_score(name):
+    """Fallback baseline crowdedness for a lot, based on its name"""
+    if "Visitor" in name:
+        return 0.5
+    elif "North" in name or "West" in name:
+        return 0.8
+    return 0.7
+
+# Popup styling shared by the folium map and the Leaflet template
+_POPUP_CSS = """
+<style>
+    .parking-popup {
+        font-family: Arial, sans-serif;
+        font-size: 12px;
+        max-width: 200px;
+    }
+    .parking-popup h4 {
+        margin: 0 0 5px 0;
+        color: #333;
+    }
+    .parking-status {
+        font-weight: bold;
+        margin-top: 5px;
+    }
+</style>
+"""
+
+_LEGEND_ITEM = """
+    <div style="margin-bottom: 5px;">
+        <span style="display: inline-block; height: 12px; width: 12px;
+                   background-color: {color}; border-radius: 50%;"></span>
+        <span style="margin-left: 5px;">{label}</span>
+    </div>"""
+
+_LEGEND_HTML = """
+<div style="position: fixed; bottom: 50px; right: 50px; width: 150px;
+            background-color: white; padding: 10px; border-radius: 5px;
+            z-index: 1000; box-shadow: 0 0 10px rgba(0,0,0,0.2);">
+    <h4 style="margin: 0 0 10px 0;">Parking Status</h4>""" + "".join(
+    _LEGEND_ITEM.format(color=color, label=label) for _, label, color in STATUS_BINS
+) + """
+    <div style="margin-top: 10px;">
+        <span style="display: inline-block; height: 20px; width: 20px;
+                   background-color: blue; border-radius: 50%; border: 3px solid white;
+                   box-shadow: 0 0 3px rgba(0,0,0,0.3);"></span>
+        <span style="margin-left: 5px;">Your Location</span>
+    </div>
+</div>
+"""
+
+# Popup header depends only on the location; the status part is rendered on each refresh
+_POPUP_HEAD_TPL = jinja2.Template("""
+<div class="parking-popup">
+    <h4>{{ location.name }}</h4>
+    <div>Address: {{ location.address or 'Not available' }}</div>
+    <div>Hours: {{ location.hours_of_operation or 'Not specified' }}</div>
+    <div>Type: {{ location.access_type }}</div>""", autoescape=True)
+
+_POPUP_STATUS_TPL = jinja2.Template("""
+    {%- if prediction %}
+    <div class="parking-status" style="color: {{ color }}">
+        Status: {{ status }} ({{ prediction['occupancy'] }}% full)
+    </div>
+    <div style="margin-top: 5px;">
+        <strong>Factors:</strong>
+        <ul style="margin: 5px 0; padding-left: 20px;">
+            <li>Time Impact: {{ prediction['factors']['time_impact'] }}x</li>
+            <li>Weather Impact: {{ prediction['factors']['weather_impact'] }}x</li>
+            <li>Event Impact: {{ prediction['factors']['event_impact'] }}x</li>
+        </ul>
+    </div>
+    {%- else %}
+    <div class="parking-status" style="color: {{ color }}">Status: {{ status }}</div>
+    {%- endif %}
+</div>
+""", autoescape=True)
+
+@functools.lru_cache(maxsize=None)
+def _static_elements():
+    """Popup CSS and legend elements, shared by every map rather than rebuilt per render"""
+    import folium
+    return folium.Element(_POPUP_CSS), folium.Element(_LEGEND_HTML)
+
+# Standalone Leaflet page used by create_map_fast, rendered once with every marker
+_DISPLAY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'display')
+_LEAFLET_TEMPLATE = jinja2.Environment(loader=jinja2.FileSystemLoader(_DISPLAY_DIR)).get_template('leaflet_map.html')
+
+# Maps are centered on campus
+_MAP_CENTER = (42.729869, -73.676871)  # RPI coordinates
+
+# Marker style for every status color, built once instead of per marker
+_STYLE = {
+    color: {"color": color, "fill": True, "fillColor": color, "fillOpacity": 0.7, "weight": 2}
+    for _, _, color in STATUS_BINS
+}
+
+# Above this many lots, markers are clustered in the browser so only visible ones are drawn
+_CLUSTER_THRESHOLD = 200
+
+# Builds a circle marker from a [lat, lon, color, popup, tooltip] row of cluster data.
+# FastMarkerCluster assigns this to its own `var callback`, so it must be a bare function expression
+_CLUSTER_CALLBACK = """
+    function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 10,
+            color: row[2],
+            fill: true,
+            fillColor: row[2],
+            fillOpacity: 0.7,
+            weight: 2
+        });
+        marker.bindPopup(row[3], {maxWidth: 300});
+        marker.bindTooltip(row[4]);
+        return marker;
+    }
+"""
 
 class ParkingVisualizer:
     def __init__(self, parking_locations, predictor=None, gmaps_client=None, weather_api_key=None):
-        self.parking_locations = parking_locations
         self.predictor = predictor
         self.gmaps_client = gmaps_client
         self.weather_api_key = weather_api_key
+        self.set_locations(parking_locations)
+
+        # Map scaffolding is built once and reused; only the marker layer is replaced on refresh
+        self._base_map = None
+        self._markers = None
+
+    def set_locations(self, parking_locations):
+        """Replace the parking locations, keeping the cached base map"""
+        self.parking_locations = parking_locations
+
+        # The finder returns the same lots on most calls; keep the derived data then
+        locations_key = tuple(parking_locations)
+        if locations_key == getattr(self, '_locations_key', None):
+            return
+        self._locations_key = locations_key
 
-    def get_status(self, location):
+        self._base_scores = {location.id: _base_score(location.name) for location in parking_locations}
+        self._base_score_array = None
+
+        # Static popup and tooltip parts only change when the locations do, so build them once
+        self._popup_prefixes = {location.id: _POPUP_HEAD_TPL.render(location=location) for location in parking_locations}
+        self._tooltip_prefixes = {location.id: f"{escape(location.name)} - " for location in parking_locations}
+
+    def get_status(self, location, current_hour=None):
         """Get status using predictor if available, otherwise use basic estimation"""
         if self.predictor and self.gmaps_client:
             try:
+                # Weather is the same across campus; rounding lets nearby lots share the predictor's cached lookup
+                weather = self.predictor.get_weather_impact(
+                    round(location.latitude, 2),
+                    round(location.longitude, 2),
+                    self.weather_api_key
+                )
                 prediction = self.predictor.predict_occupancy(
                     location=location,
                     gmaps_client=self.gmaps_client,
-                    weather_api_key=self.weather_api_key
+                    weather_api_key=self.weather_api_key,
+                    weather=weather
                 )
                 return prediction['status'], prediction['color'], prediction
             except Exception as e:
-                print(f"Error using predictor for {location.name}: {e}")
-                return self.estimate_crowdedness(location)
-        return self.estimate_crowdedness(location)
+                log.warning("Error using predictor for %s: %s", location.name, e)
+                return self.estimate_crowdedness(location, current_hour)
+        return self.estimate_crowdedness(location, current_hour)
+        
+    def get_all_statuses(self, current_hour=None):
+        """Get statuses for every location keyed by id, batching the predictor's API calls"""
+        if self.predictor and self.gmaps_client:
+            try:
+                predictions = self.predictor.predict_occupancy_batch(
+                    self.parking_locations,
+                    gmaps_client=self.gmaps_client,
+                    weather_api_key=self.weather_api_key
+                )
+                return {
+                    location.id: (prediction['status'], prediction['color'], prediction)
+                    for location, prediction in zip(self.parking_locations, predictions)
+                }
+            except Exception as e:
+                log.warning("Error using batch predictor: %s", e)
+        else:
+            # Without a predictor every lot is scored in one vectorized pass
+            statuses, colors = self.estimate_all(current_hour)
+            return {
+                location.id: (status, color, None)
+                for location, status, color in zip(self.parking_locations, statuses.tolist(), colors.tolist())
+            }
         
+        # Per-location predictions are independent API calls, so overlap them
+        with ThreadPoolExecutor(max_workers=max(1, min(32, len(self.parking_locations)))) as executor:
+            results = list(executor.map(
+                functools.partial(self.get_status, current_hour=current_hour),
+                self.parking_locations
+            ))
+        return {location.id: result for location, result in zip(self.parking_locations, results)}
+
     def estimate_crowdedness(self, location, current_hour=None):
         """Fallback estimation if predictor is not available"""
         if current_hour is None:
             current_hour = datetime.now().hour
             
-        peak_hours = set(range(8, 11)) | set(range(13, 16))
-        moderate_hours = set(range(11, 13)) | set(range(16, 18))
-        
-        if "Visitor" in location.name:
-            base_score = 0.5
-        elif "North" in location.name or "West" in location.name:
-            base_score = 0.8
-        else:
-            base_score = 0.7
+        base_score = self._base_scores.get(location.id)
+        if base_score is None:
+            base_score = _base_score(location.name)
             
-        if current_hour in peak_hours:
-            time_multiplier = 1.0
-        elif current_hour in moderate_hours:
-            time_multiplier = 0.7
-        else:
-            time_multiplier = 0.4
+        time_multiplier = _TIME_MULT[current_hour]
             
         crowdedness = base_score * time_multiplier
         
-        if crowdedness > 0.7:
-            return "High", "red", None
-        elif crowdedness > 0.4:
-            return "Medium", "yellow", None
+        status, color = classify_occupancy(crowdedness)
+        return status, color, None
+    
+    def estimate_all(self, current_hour=None):
+        """Fallback estimation for every location at once, returning status and color arrays"""
+        if current_hour is None:
+            current_hour = datetime.now().hour
+        
+        import numpy as np
+        
+        if self._base_score_array is None:
+            self._base_score_array = np.fromiter(
+                (self._base_scores[location.id] for location in self.parking_locations),
+                dtype=np.float64,
+                count=len(self.parking_locations)
+            )
+        
+        # Large deployments classify in a compiled loop; small ones never pay the JIT cost
+        if len(self._base_score_array) > _NUMBA_THRESHOLD:
+            bins = _score_kernel()(self._base_score_array, _TIME_MULT[current_hour], np.array(_CROWDEDNESS_EDGES))
         else:
-            return "Low", "green", None
+            crowdedness = self._base_score_array * _TIME_MULT[current_hour]
+            bins = np.digitize(crowdedness, _CROWDEDNESS_EDGES)
+        return np.array(_CROWDEDNESS_STATUSES)[bins], np.array(_CROWDEDNESS_COLORS)[bins]
     
-    def create_map(self):
-        """Create an interactive map with parking locations"""
-        print("Initializing map...")
+    def _build_base_map(self):
+        """Build the parts of the map that don't change between refreshes"""
+        import folium
+        from folium import plugins
         
+        popup_css, legend = _static_elements()
         m = folium.Map(
-            location=[42.729869, -73.676871],  # RPI coordinates
+            location=list(_MAP_CENTER),
             zoom_start=16,
             tiles="OpenStreetMap"
         )
 
         # Add custom CSS for popup styling
-        m.get_root().html.add_child(folium.Element("""
-            <style>
-                .parking-popup {
-                    font-family: Arial, sans-serif;
-                    font-size: 12px;
-                    max-width: 200px;
-                }
-                .parking-popup h4 {
-                    margin: 0 0 5px 0;
-                    color: #333;
-                }
-                .parking-status {
-                    font-weight: bold;
-                    margin-top: 5px;
-                }
-            </style>
-        """))
+        m.get_root().html.add_child(popup_css)
 
         # Add location control
         plugins.LocateControl(
@@ -98,94 +311,134 @@ class ParkingVisualizer:
                 'watch': True
             }
         ).add_to(m)
+
+        # Add legend
+        m.get_root().html.add_child(legend)
+
+        return m
+
+    def _marker_data(self):
+        """Build the marker data for every location with current statuses"""
+        # Get statuses using predictor or basic estimation
+        statuses = self.get_all_statuses(current_hour=datetime.now().hour)
+        
+        log.debug("Adding parking locations to map...")
+        markers = []
+        
+        # Resolve per-marker helpers once rather than on every iteration
+        render_status = _POPUP_STATUS_TPL.render
+        popup_prefixes = self._popup_prefixes
+        tooltip_prefixes = self._tooltip_prefixes
+        add_marker = markers.append
         
-        print("Adding parking locations to map...")
         for location in self.parking_locations:
-            print(f"Adding location: {location.name}")
+            # Read each location field once
+            location_id = location.id
+            log.debug("Adding location: %s", location.name)
             
-            # Get status using predictor or basic estimation
-            status, color, prediction = self.get_status(location)
+            status, color, prediction = statuses[location_id]
             
             # Create popup content
-            if prediction:
-                popup_html = f"""
-                    <div class="parking-popup">
-                        <h4>{location.name}</h4>
-                        <div>Address: {location.address or 'Not available'}</div>
-                        <div>Hours: {location.hours_of_operation or 'Not specified'}</div>
-                        <div>Type: {location.access_type}</div>
-                        <div class="parking-status" style="color: {color}">
-                            Status: {status} ({prediction['occupancy']}% full)
-                        </div>
-                        <div style="margin-top: 5px;">
-                            <strong>Factors:</strong>
-                            <ul style="margin: 5px 0; padding-left: 20px;">
-                                <li>Time Impact: {prediction['factors']['time_impact']}x</li>
-                                <li>Weather Impact: {prediction['factors']['weather_impact']}x</li>
-                                <li>Event Impact: {prediction['factors']['event_impact']}x</li>
-                            </ul>
-                        </div>
-                    </div>
-                """
-            else:
-                popup_html = f"""
-                    <div class="parking-popup">
-                        <h4>{location.name}</h4>
-                        <div>Address: {location.address or 'Not available'}</div>
-                        <div>Hours: {location.hours_of_operation or 'Not specified'}</div>
-                        <div>Type: {location.access_type}</div>
-                        <div class="parking-status" style="color: {color}">Status: {status}</div>
-                    </div>
-                """
+            status_html = render_status(status=status, color=color, prediction=prediction)
             
-            # Add marker to map
-            folium.CircleMarker(
-                location=[location.latitude, location.longitude],
-                radius=10,
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=f"{location.name} - {status}",
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=0.7,
-                weight=2
-            ).add_to(m)
+            add_marker({
+                "id": location_id,
+                "lat": location.latitude,
+                "lon": location.longitude,
+                "color": color,
+                "status": status,
+                "popup": popup_prefixes[location_id] + status_html,
+                "tooltip": tooltip_prefixes[location_id] + status
+            })
+        
+        return markers
 
-        # Add legend
-        legend_html = """
-        <div style="position: fixed; bottom: 50px; right: 50px; width: 150px;
-                    background-color: white; padding: 10px; border-radius: 5px;
-                    z-index: 1000; box-shadow: 0 0 10px rgba(0,0,0,0.2);">
-            <h4 style="margin: 0 0 10px 0;">Parking Status</h4>
-            <div style="margin-bottom: 5px;">
-                <span style="display: inline-block; height: 12px; width: 12px;
-                           background-color: green; border-radius: 50%;"></span>
-                <span style="margin-left: 5px;">Available</span>
-            </div>
-            <div style="margin-bottom: 5px;">
-                <span style="display: inline-block; height: 12px; width: 12px;
-                           background-color: yellow; border-radius: 50%;"></span>
-                <span style="margin-left: 5px;">Moderate</span>
-            </div>
-            <div style="margin-bottom: 5px;">
-                <span style="display: inline-block; height: 12px; width: 12px;
-                           background-color: orange; border-radius: 50%;"></span>
-                <span style="margin-left: 5px;">Nearly Full</span>
-            </div>
-            <div>
-                <span style="display: inline-block; height: 12px; width: 12px;
-                           background-color: red; border-radius: 50%;"></span>
-                <span style="margin-left: 5px;">Full</span>
-            </div>
-            <div style="margin-top: 10px;">
-                <span style="display: inline-block; height: 20px; width: 20px;
-                           background-color: blue; border-radius: 50%; border: 3px solid white;
-                           box-shadow: 0 0 3px rgba(0,0,0,0.3);"></span>
-                <span style="margin-left: 5px;">Your Location</span>
-            </div>
-        </div>
-        """
-        m.get_root().html.add_child(folium.Element(legend_html))
+    def refresh_markers(self):
+        """Build the parking marker layer with current statuses"""
+        import folium
+        from folium import plugins
+        
+        markers = self._marker_data()
+
+        # GeoJSON popups need at least one feature to render, so leave an empty layer in its place
+        if not markers:
+            return folium.FeatureGroup(name="Parking")
+
+        # Large lot sets are clustered client-side so off-screen markers never become DOM nodes
+        if len(markers) > _CLUSTER_THRESHOLD:
+            rows = [[m["lat"], m["lon"], m["color"], m["popup"], m["tooltip"]] for m in markers]
+            return plugins.FastMarkerCluster(rows, callback=_CLUSTER_CALLBACK, name="Parking")
+
+        # Add each marker as a GeoJSON point
+        features = [
+            {
+                "type": "Feature",
+                "id": m["id"],
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [m["lon"], m["lat"]]
+                },
+                "properties": {
+                    "color": m["color"],
+                    "popup": m["popup"],
+                    "tooltip": m["tooltip"]
+                }
+            }
+            for m in markers
+        ]
+
+        # One GeoJSON layer renders all markers in a single pass instead of one layer each
+        return folium.GeoJson(
+            {"type": "FeatureCollection", "features": features},
+            name="Parking",
+            marker=folium.CircleMarker(radius=10),
+            style_function=lambda feature: _STYLE[feature["properties"]["color"]],
+            popup=folium.GeoJsonPopup(fields=["popup"], labels=False, max_width=300),
+            tooltip=folium.GeoJsonTooltip(fields=["tooltip"], labels=False)
+        )
+
+    def _remove_layer(self, layer):
+        """Detach a layer from the base map, including what earlier renders left on the figure"""
+        names = []
+        elements = [layer]
+        while elements:
+            element = elements.pop()
+            names.append(element.get_name())
+            elements.extend(element._children.values())
+        names = tuple(names)
+
+        # Rendered elements register their scripts and styles under keys derived from their names
+        root = self._base_map.get_root()
+        for section in (root.header, root.script):
+            for key in [key for key in section._children if key.startswith(names)]:
+                del section._children[key]
+        self._base_map._children.pop(layer.get_name(), None)
+
+    def create_map(self):
+        """Create an interactive map with parking locations"""
+        log.debug("Initializing map...")
         
-        print("Map creation complete")
-        return m
\ No newline at end of file
+        if self._base_map is None:
+            self._base_map = self._build_base_map()
+        
+        # Swap the previous marker layer for a fresh one
+        if self._markers is not None:
+            self._remove_layer(self._markers)
+        self._markers = self.refresh_markers().add_to(self._base_map)
+        
+        log.debug("Map creation complete")
+        return self._base_map
+
+    def render_html(self):
+        """Render the full map page to an HTML string"""
+        return self.create_map().get_root().render()
+
+    def create_map_fast(self):
+        """Render the map straight to Leaflet HTML from a single template, skipping folium"""
+        return _LEAFLET_TEMPLATE.render(
+            markers_json=_script_json(self._marker_data()),
+            center=list(_MAP_CENTER),
+            zoom=16,
+            popup_css=_POPUP_CSS,
+            legend_html=_LEGEND_HTML
+        )
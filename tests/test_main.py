@@ -0,0 +1,48 @@
+import importlib
+
+import pytest
+
+from models.parking_spot import ParkingLocation
+
+
+LOTS = [
+    ParkingLocation(id="lot_a", name="Lot A", latitude=42.7314, longitude=-73.6753, access_type="public"),
+    ParkingLocation(id="lot_b", name="Lot B", latitude=42.7308, longitude=-73.6819, access_type="public"),
+]
+
+
+@pytest.fixture
+def main_module(monkeypatch):
+    monkeypatch.setenv('GOOGLE_API_KEY', 'AIzaTestKeyForUnitTests')
+    monkeypatch.setenv('WEATHER_API_KEY', '')
+    main = importlib.import_module('main')
+
+    # Keep the endpoint off the network
+    predictor = main.predictor
+    monkeypatch.setattr(main.finder, 'get_parking_locations', lambda *args, **kwargs: list(LOTS))
+    monkeypatch.setattr(predictor, 'get_nearby_events',
+                        lambda *args, **kwargs: ([], predictor.build_event_arrays([])))
+    return main
+
+
+def test_update_parking_skips_lots_whose_prediction_fails(main_module, monkeypatch):
+    """A failing lot is left out, so every row still has what the live map reads"""
+    predictor = main_module.predictor
+    predict = predictor.predict_occupancy_precomputed
+
+    def flaky_predict(location, *args, **kwargs):
+        if location.id == "lot_a":
+            raise RuntimeError("prediction failed")
+        return predict(location, *args, **kwargs)
+
+    monkeypatch.setattr(predictor, 'predict_occupancy_precomputed', flaky_predict)
+    response = main_module.app.test_client().post(
+        '/update_parking', json={'latitude': 42.73, 'longitude': -73.67}
+    )
+
+    assert response.status_code == 200
+    rows = response.get_json()
+    assert [row['name'] for row in rows] == ["Lot B"]
+    for row in rows:
+        assert {'latitude', 'longitude', 'color', 'status', 'occupancy'} <= row.keys()
+        assert {'time_impact', 'weather_impact', 'event_impact'} <= row['factors'].keys()
@@ -0,0 +1,167 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from models.parking_spot import ParkingLocation
+from services.parking_predictor import NearbyEvent, ParkingPredictor, calculate_distance
+
+
+class StubGmaps:
+    """Places client returning one busy stadium next to campus"""
+
+    def __init__(self):
+        self.nearby_calls = 0
+        self.place_calls = 0
+
+    def places_nearby(self, **kwargs):
+        self.nearby_calls += 1
+        return {'results': [{
+            'place_id': 'stadium_1',
+            'types': ['stadium', 'point_of_interest'],
+            'geometry': {'location': {'lat': 42.7305, 'lng': -73.6760}}
+        }]}
+
+    def place(self, place_id):
+        self.place_calls += 1
+        return {'result': {
+            'name': 'ECAV Stadium',
+            'business_status': 'OPERATIONAL',
+            'current_popularity': 80,
+            'rating': 4.5,
+            'user_ratings_total': 2000
+        }}
+
+
+@pytest.fixture
+def predictor():
+    return ParkingPredictor()
+
+
+def test_get_nearby_events_builds_and_caches_events(predictor):
+    gmaps = StubGmaps()
+    events, arrays = predictor.get_nearby_events(gmaps, 42.7298, -73.6768)
+
+    assert [event.place_type for event in events] == ['stadium']
+    assert arrays.venue_weights.tolist() == [predictor.venue_type_weights['stadium']]
+
+    # A second lookup in the same cell is served from the cache
+    predictor.get_nearby_events(gmaps, 42.7298, -73.6768)
+    assert (gmaps.nearby_calls, gmaps.place_calls) == (1, 1)
+
+
+def test_calculate_event_impact_counts_nearby_venue(predictor):
+    events, arrays = predictor.get_nearby_events(StubGmaps(), 42.7298, -73.6768)
+    lot = ParkingLocation(id="lot", name="Lot", latitude=42.7300, longitude=-73.6765)
+
+    impact = predictor.calculate_event_impact(lot, events, datetime(2024, 10, 5, 14), arrays)
+
+    assert impact['factor'] > 1.0
+    assert [venue['name'] for venue in impact['venues']] == ['ECAV Stadium']
+
+
+def reference_time_factor(predictor, timestamp, lot_type):
+    """Per-call period scan the hour-of-week table replaced"""
+    is_weekend = timestamp.weekday() >= 5
+    time_periods = predictor.time_factors['weekend'] if is_weekend else predictor.time_factors['weekday']
+
+    time_factor = 1.0
+    period_name = "Normal hours"
+    for period, (start, end, factor) in time_periods.items():
+        if start <= timestamp.hour < end or (start > end and (timestamp.hour >= start or timestamp.hour < end)):
+            time_factor = factor
+            period_name = period
+            break
+
+    lot_sensitivity = predictor.lot_characteristics[lot_type]['time_sensitivity']
+    return {'factor': 1 + ((time_factor - 1) * lot_sensitivity), 'description': period_name}
+
+
+def test_time_factor_table_matches_period_scan(predictor):
+    # 2024-01-01 is a Monday, so this walks every hour of one week
+    for lot_type in predictor.lot_characteristics:
+        for hour_of_week in range(168):
+            timestamp = datetime(2024, 1, 1 + hour_of_week // 24, hour_of_week % 24)
+            assert predictor.get_time_factor(timestamp, lot_type) == \
+                reference_time_factor(predictor, timestamp, lot_type)
+
+
+class StubWeatherResponse:
+    def __init__(self, temp):
+        self.temp = temp
+
+    def json(self):
+        return {'weather': [{'main': 'Clear'}], 'main': {'temp': self.temp}}
+
+
+@pytest.mark.parametrize('temp', [-20, 14.9, 15, 31.9, 32, 44.5, 45, 64.9, 65, 74, 75, 84.9, 85, 110])
+def test_temperature_lookup_matches_range_scan(predictor, monkeypatch, temp):
+    monkeypatch.setattr(predictor._http, 'get', lambda url, timeout=None: StubWeatherResponse(temp))
+
+    expected = next(impact for min_temp, max_temp, impact in predictor.temperature_factors
+                    if min_temp <= temp < max_temp)
+    assert predictor.get_weather_impact(42.73, -73.68, 'key')['factor'] == expected
+
+
+def reference_event_impact(predictor, lot, events):
+    """Per-event Haversine loop the vectorized event impact replaced"""
+    total_impact = 1.0
+    venues = {}
+    for event in events:
+        if not event.is_operational:
+            continue
+        distance = calculate_distance(lot.latitude, lot.longitude, event.latitude, event.longitude)
+        if distance > 1.0:
+            continue
+
+        popularity_factor = 1.0
+        if event.current_popularity is not None:
+            popularity_factor = 1 + (event.current_popularity / 100)
+        rating_factor = 1.0
+        if event.rating is not None and event.user_ratings_total is not None:
+            rating_factor = 1 + (((event.rating / 5) - 0.5) * min(1.0, event.user_ratings_total / 1000))
+
+        impact = 1 + (
+            predictor.venue_type_weights.get(event.place_type, 1.0) *
+            (1 - distance) *
+            popularity_factor *
+            rating_factor - 1
+        ) * 0.5
+        total_impact = max(total_impact, impact)
+        venues[event.name] = impact
+    return total_impact, venues
+
+
+def test_event_impact_matches_haversine_loop(predictor):
+    rng = np.random.default_rng(7)
+    place_types = list(predictor.venue_type_weights) + ['other']
+    events = [
+        NearbyEvent(
+            name=f"Venue {i}",
+            venue_name=f"Venue {i}",
+            latitude=42.73 + rng.uniform(-0.015, 0.015),
+            longitude=-73.68 + rng.uniform(-0.02, 0.02),
+            place_type=place_types[i % len(place_types)],
+            is_operational=bool(rng.random() < 0.9),
+            current_popularity=None if i % 3 == 0 else float(rng.integers(0, 100)),
+            rating=None if i % 4 == 0 else float(rng.uniform(1, 5)),
+            user_ratings_total=None if i % 5 == 0 else int(rng.integers(0, 3000))
+        )
+        for i in range(300)
+    ]
+    arrays = predictor.build_event_arrays(events)
+    now = datetime(2024, 10, 5, 14)
+
+    for j in range(50):
+        lot = ParkingLocation(id=f"lot_{j}", name=f"Lot {j}",
+                              latitude=42.73 + rng.uniform(-0.01, 0.01),
+                              longitude=-73.68 + rng.uniform(-0.013, 0.013))
+        impact = predictor.calculate_event_impact(lot, events, now, arrays)
+        expected_factor, expected_venues = reference_event_impact(predictor, lot, events)
+
+        # The local flat-earth distance differs from Haversine by well under a meter at this range
+        assert impact['factor'] == pytest.approx(expected_factor, abs=1e-4)
+        reported = {venue['name'] for venue in impact['venues']}
+        for name, expected_impact in expected_venues.items():
+            if abs(expected_impact - 1.1) > 1e-4:
+                assert (name in reported) == (expected_impact > 1.1)
@@ -0,0 +1,40 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from models.parking_spot import ParkingLocation
+from services.parking_visualizer import ParkingVisualizer, _CLUSTER_THRESHOLD, _NUMBA_THRESHOLD
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is needed to syntax-check the map script")
+def test_clustered_map_script_is_valid_js(tmp_path):
+    """Maps above the cluster threshold must emit scripts that parse"""
+    locations = [
+        ParkingLocation(id=f"lot_{i}", name=f"Lot {i}", latitude=42.73 + i * 1e-4, longitude=-73.67)
+        for i in range(_CLUSTER_THRESHOLD + 50)
+    ]
+    html = ParkingVisualizer(locations).create_map().get_root().render()
+    assert "markerClusterGroup" in html
+
+    script = tmp_path / "map.js"
+    script.write_text("\n".join(re.findall(r"<script>(.*?)</script>", html, re.S)))
+    result = subprocess.run(["node", "--check", str(script)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_fallback_kernel_matches_scalar_estimate():
+    """Above the numba threshold, estimate_all must agree with estimate_crowdedness lot by lot"""
+    names = ["Visitor Lot", "North Lot", "West Garage", "Main Lot"]
+    locations = [
+        ParkingLocation(id=f"lot_{i}", name=names[i % len(names)], latitude=42.73, longitude=-73.67)
+        for i in range(_NUMBA_THRESHOLD + 300)
+    ]
+    visualizer = ParkingVisualizer(locations)
+
+    for hour in range(24):
+        statuses, colors = visualizer.estimate_all(hour)
+        assert [
+            (status, color, None) for status, color in zip(statuses.tolist(), colors.tolist())
+        ] == [visualizer.estimate_crowdedness(location, hour) for location in locations]